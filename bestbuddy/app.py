@@ -1,13 +1,34 @@
 # app.py
+import re
+
 import streamlit as st
 from assistant import VoiceAssistant
-import threading
-
-# Create assistant instance (loads models lazily)
-assistant = VoiceAssistant()
+from concurrent.futures import ThreadPoolExecutor
 
 st.set_page_config(page_title="BestBuddy", page_icon="🎧", layout="centered")
 
+# Markdown / LaTeX syntax characters, backslash-escaped in message text (see _escape_md)
+_MD_SPECIAL_RE = re.compile(r"([\\`*_{}\[\]()#+\-.!|<>~$])")
+
+
+def _escape_md(text: str) -> str:
+    # Messages share one markdown element, so unescaped syntax (an unclosed ``` or **) in one
+    # message would change how every later message renders; line breaks are kept as hard breaks
+    return _MD_SPECIAL_RE.sub(r"\\\1", text).replace("\n", "  \n")
+
+
+@st.cache_resource
+def get_assistant() -> VoiceAssistant:
+    # One assistant per process; models inside it load lazily on first use
+    return VoiceAssistant()
+
+
+@st.cache_resource
+def get_voice_worker() -> ThreadPoolExecutor:
+    # Single long-lived thread for voice interactions (one at a time, no per-click thread spawn)
+    return ThreadPoolExecutor(max_workers=1)
+
+
 st.title("🎧 BestBuddy — Multilingual AI Assistant")
 st.markdown("Supports English, Hindi, and Marathi. Use Text or Voice mode. (Offline-first TTS)")
 
@@ -22,16 +43,23 @@ if "busy" not in st.session_state:
     st.session_state.busy = False
 
 def add_message(role: str, text: str):
-    st.session_state.responses.append({"role": role, "text": text})
+    # copy + assign back instead of mutating in place, so a voice-worker write can't race a rerun
+    responses = list(st.session_state.responses)
+    responses.append({"role": role, "text": text})
+    st.session_state.responses = responses
 
 def process_user_input(user_text: str):
     st.session_state.busy = True
+    assistant = get_assistant()
     try:
-        reply, lang = assistant.answer(user_text)
+        # Stream the reply clause by clause; each clause is spoken as soon as it is ready.
+        # The placeholder is cleared afterwards since the reply is shown in the conversation below.
+        live = st.empty()
+        with live.container():
+            reply = st.write_stream(assistant.answer_streaming(user_text))
+        live.empty()
         add_message("user", user_text)
-        add_message("assistant", reply)
-        # speak reply asynchronously (so Streamlit UI doesn't freeze too long)
-        assistant.speak(reply, lang=lang)
+        add_message("assistant", reply.strip() if isinstance(reply, str) else str(reply))
     except Exception as e:
         add_message("assistant", f"Error: {str(e)}")
     finally:
@@ -55,14 +83,16 @@ else:
         stop_listen = st.button("Stop (no-op)")
 
     if start_listen and not st.session_state.busy:
-        # Run listening in a separate thread to keep UI responsive
+        # Run listening on the long-lived voice worker to keep UI responsive
+        assistant = get_assistant()
+
         def listen_and_process():
             st.session_state.busy = True
             try:
                 text, lang = assistant.listen_once()
                 if text:
                     add_message("user", text)
-                    reply, _lang = assistant.answer(text)
+                    reply, _lang = assistant.answer(text, lang)
                     add_message("assistant", reply)
                     assistant.speak(reply, lang=_lang)
                 else:
@@ -72,29 +102,23 @@ else:
             finally:
                 st.session_state.busy = False
 
-        t = threading.Thread(target=listen_and_process, daemon=True)
-        t.start()
+        get_voice_worker().submit(listen_and_process)
 
 # Display conversation
 st.subheader("Conversation")
-for msg in st.session_state.responses:
-    role = msg["role"]
-    text = msg["text"]
-    if role == "user":
-        st.markdown(f"**You:** {text}")
-    else:
-        st.markdown(f"**BestBuddy:** {text}")
+# One markdown element for the whole history instead of one per message
+history_md = "\n\n".join(
+    f"**{'You' if msg['role'] == 'user' else 'BestBuddy'}:** {_escape_md(msg['text'])}"
+    for msg in st.session_state.responses
+)
+if history_md:
+    st.markdown(history_md)
 
 if show_history:
     st.subheader("Short Memory (persisted)")
-    try:
-        import json, os
-        mem_path = os.path.join(".", "memory.json")
-        if os.path.exists(mem_path):
-            with open(mem_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            st.json(data.get("history", []))
-        else:
-            st.write("No memory yet.")
-    except Exception as e:
-        st.write("Could not load memory:", e)
+    # Read the assistant's live history instead of re-parsing memory.json on every rerun
+    history = get_assistant().get_memory()
+    if history:
+        st.json(history)
+    else:
+        st.write("No memory yet.")
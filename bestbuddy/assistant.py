@@ -1,67 +1,249 @@
 # assistant.py
 import os
+import re
 import sys
 import subprocess
 import webbrowser
+import collections
 import datetime
+import functools
 import json
+import queue
 import tempfile
+import threading
 import time
-from typing import Tuple, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from io import BytesIO
+from typing import Dict, Iterator, List, Tuple, Optional
 
+import numpy as np
 import speech_recognition as sr
 import pyttsx3
+import requests
+from requests.adapters import HTTPAdapter
+import gtts.tts as gtts_tts
 from gtts import gTTS
 from playsound import playsound
-from langdetect import detect, LangDetectException
 
-from nlp_model import MultilingualNLP
+try:
+    import miniaudio  # optional: in-process mp3 decode + playback
+except ImportError:
+    miniaudio = None
+
+try:
+    import webrtcvad  # optional: VAD end-pointing instead of energy threshold + calibration
+except ImportError:
+    webrtcvad = None
+
+try:
+    from faster_whisper import WhisperModel  # optional: local multilingual speech recognition
+except ImportError:
+    WhisperModel = None
+
+from nlp_model import (
+    SUPPORTED_LANGS,
+    MultilingualNLP,
+    _json_dumps,
+    _json_loads,
+    detect_language,
+    match_intent,
+    split_clauses,
+)
+
+# Google recognizer language hints tried for every utterance (fallback when faster-whisper is unavailable)
+RECOGNITION_LANGS = ("hi-IN", "mr-IN", "en-US")
+# faster-whisper model size for local recognition; int8 weights, language detected per utterance
+WHISPER_MODEL = os.environ.get("BB_WHISPER_MODEL", "small")
+WHISPER_SAMPLE_RATE = 16000
+# gTTS produces 24 kHz mono mp3; decode straight to that format for playback
+PLAYBACK_SAMPLE_RATE = 24000
+# How often the open microphone is re-calibrated for ambient noise
+MIC_RECALIBRATE_SECS = 300
+# webrtcvad end-pointing: 30 ms frames at 16 kHz, stop after ~600 ms of silence
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_SAMPLES = 480
+VAD_AGGRESSIVENESS = 2
+VAD_END_SILENCE_FRAMES = 20
+VAD_PREROLL_FRAMES = 10
+
+# Pending offline utterances kept for speak(); older ones are dropped once this many are waiting
+OFFLINE_QUEUE_LIMIT = 8
+
+# Fixed replies pre-rendered at startup when there is no offline engine, as (text, gTTS language)
+CANNED_PHRASES = (
+    ("Opening WhatsApp.", "en"),
+    ("Opening YouTube.", "en"),
+    ("Opening your Music folder.", "en"),
+    ("Opening YouTube Music.", "en"),
+    ("I couldn't open WhatsApp.", "en"),
+    ("I couldn't open YouTube.", "en"),
+    ("I couldn't open that website.", "en"),
+    ("I couldn't play music right now.", "en"),
+)
+# Reply prefixes cached on their own; only the variable tail is synthesized per call
+CANNED_PREFIXES = (
+    ("The current time is", "en"),
+    ("समय है", "hi"),
+    ("सध्याचा वेळ", "mr"),
+)
+
+# Domain (optionally with scheme and path) somewhere in the query; the last label must be
+# alphabetic so numbers like "3.5" don't count as websites
+_URL_RE = re.compile(r"\b(?:https?://)?[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}\b(?:/\S*)?", re.IGNORECASE)
+
+
+class _KeepAliveSession(requests.Session):
+    # gTTS wraps every request in `with requests.Session()`; don't let that close the shared pool
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class _SharedSessionRequests:
+    """
+    Stand-in for the `requests` module inside gtts.tts that hands out one keep-alive Session,
+    so consecutive utterances reuse the same TLS connection instead of handshaking each time.
+    """
+
+    def __init__(self, session: requests.Session) -> None:
+        self._session = session
+
+    def Session(self) -> requests.Session:
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def _install_gtts_session() -> None:
+    session = _KeepAliveSession()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    if hasattr(gtts_tts, "requests"):
+        gtts_tts.requests = _SharedSessionRequests(session)
 
-# Supported language mapping
-SUPPORTED_LANGS = {"en": "english", "hi": "hindi", "mr": "marathi"}
+
+_install_gtts_session()
 
 
 class TTSManager:
     """
     Handles TTS: offline via pyttsx3 first, then fallback to gTTS (online).
-    Saves temporary mp3 and plays it; removes the temp file after playing.
+    Online replies are split into clauses that are synthesized in parallel and
+    played back in order, so the first clause is audible while the rest download.
     """
 
     def __init__(self) -> None:
+        # pyttsx3 lives on its own worker thread, started on first use
         self.offline_engine = None
+        # unbounded; speak_offline trims it to OFFLINE_QUEUE_LIMIT unless asked not to
+        self._offline_q: "queue.Queue[str]" = queue.Queue()
+        self._offline_ready = threading.Event()
+        self._offline_thread: Optional[threading.Thread] = None
+        self._offline_start_lock = threading.Lock()
+
+        # gTTS synthesis pool + ordered playback queue (consumer started lazily)
+        self._synth_pool = ThreadPoolExecutor(max_workers=4)
+        self._playback_q: "queue.Queue[Future]" = queue.Queue()
+        self._playback_thread: Optional[threading.Thread] = None
+        # miniaudio output device, opened by the playback thread on first use
+        self._device = None
+        # Fixed command replies, pre-rendered with gTTS only if the offline engine is unavailable
+        # (see _prerender_canned); otherwise startup makes no network calls
+        self._audio_cache: Dict[Tuple[str, str], bytes] = {}
+        self._synth_pool.submit(self._prerender_canned)
+
+    def _tts_loop(self) -> None:
+        # The engine is created and driven from this thread only; runAndWait is not re-entrant
         try:
-            self.offline_engine = pyttsx3.init()
+            engine = pyttsx3.init()
             # Optionally configure rate/voice
-            self.offline_engine.setProperty("rate", 160)
+            engine.setProperty("rate", 160)
         except Exception:
-            self.offline_engine = None
+            engine = None
+        self.offline_engine = engine
+        self._offline_ready.set()
+        if engine is None:
+            return
+        while True:
+            text = self._offline_q.get()
+            try:
+                engine.say(text)
+                engine.runAndWait()
+            except Exception:
+                pass
 
-    def speak_offline(self, text: str) -> bool:
-        if not self.offline_engine:
-            return False
-        try:
-            self.offline_engine.say(text)
-            self.offline_engine.runAndWait()
-            return True
-        except Exception:
-            return False
+    def _ensure_offline_engine(self) -> bool:
+        # also called from the background pre-render task; start the worker only once
+        with self._offline_start_lock:
+            if self._offline_thread is None:
+                self._offline_thread = threading.Thread(target=self._tts_loop, daemon=True)
+                self._offline_thread.start()
+        self._offline_ready.wait(timeout=5)
+        return self.offline_engine is not None
 
-    def speak_online(self, text: str, lang: str = "en") -> bool:
+    def speak_offline(self, text: str, drop_stale: bool = True) -> bool:
         """
-        Use gTTS to create an mp3 and play it using playsound or platform opener.
-        Returns True if played, False otherwise.
+        Queue text for the offline engine and return immediately.
+        With drop_stale, once OFFLINE_QUEUE_LIMIT utterances are pending the oldest is dropped in
+        favour of the new one. Clauses of a streamed reply pass drop_stale=False so none are lost.
         """
+        if not self._ensure_offline_engine():
+            return False
+        if drop_stale:
+            while self._offline_q.qsize() >= OFFLINE_QUEUE_LIMIT:
+                try:
+                    self._offline_q.get_nowait()
+                except queue.Empty:
+                    break
+        self._offline_q.put(text)
+        return True
+
+    @staticmethod
+    def _synthesize(text: str, gtts_lang: str) -> BytesIO:
+        buf = BytesIO()
+        gTTS(text=text, lang=gtts_lang).write_to_fp(buf)
+        buf.seek(0)
+        return buf
+
+    @staticmethod
+    def _pcm_stream(samples, done: threading.Event):
+        # miniaudio pulls `required_frames` at a time from this generator (mono, so frames == samples)
+        pos = 0
+        required_frames = yield b""
+        while pos < len(samples):
+            chunk = samples[pos:pos + required_frames]
+            pos += len(chunk)
+            required_frames = yield chunk
+        done.set()
+
+    def _play_mp3_inprocess(self, buf: BytesIO) -> None:
+        decoded = miniaudio.decode(
+            buf.getvalue(),
+            output_format=miniaudio.SampleFormat.SIGNED16,
+            nchannels=1,
+            sample_rate=PLAYBACK_SAMPLE_RATE,
+        )
+        if self._device is None:
+            self._device = miniaudio.PlaybackDevice(
+                output_format=miniaudio.SampleFormat.SIGNED16,
+                nchannels=1,
+                sample_rate=PLAYBACK_SAMPLE_RATE,
+            )
+        done = threading.Event()
+        stream = self._pcm_stream(decoded.samples, done)
+        next(stream)
+        self._device.start(stream)
+        try:
+            done.wait(timeout=decoded.duration + 2.0)
+        finally:
+            self._device.stop()
+
+    @staticmethod
+    def _play_mp3_external(buf: BytesIO) -> None:
+        # playsound needs a path, so the synthesized clause is written out just for playback
+        tmp_fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(buf.getvalue())
         try:
-            # Map language codes for gTTS: 'hi' and 'mr' are supported
-            gtts_lang = "en"
-            if lang in ("hi", "mr"):
-                gtts_lang = lang
-            # Save to temp file
-            tmp_fd, tmp_path = tempfile.mkstemp(suffix=".mp3")
-            os.close(tmp_fd)
-            tts = gTTS(text=text, lang=gtts_lang)
-            tts.save(tmp_path)
-
             # Try playsound first (cross-platform)
             try:
                 playsound(tmp_path)
@@ -76,12 +258,117 @@ class TTSManager:
                     subprocess.run(["xdg-open", tmp_path], check=False)
                 # give some time for external player to start
                 time.sleep(1.5)
-
+        finally:
             # Remove temp file
             try:
                 os.remove(tmp_path)
             except Exception:
                 pass
+
+    def _play_mp3(self, buf: BytesIO) -> None:
+        """
+        Decode and play in-process with miniaudio when available (no temp file, no subprocess,
+        returns when playback actually finishes); otherwise use playsound / the platform opener.
+        """
+        if miniaudio is not None:
+            try:
+                self._play_mp3_inprocess(buf)
+                return
+            except Exception:
+                pass
+        self._play_mp3_external(buf)
+
+    def _playback_loop(self) -> None:
+        # Futures arrive in clause order; block on each one so playback order is preserved
+        while True:
+            fut = self._playback_q.get()
+            try:
+                self._play_mp3(fut.result())
+            except Exception:
+                pass
+            finally:
+                self._playback_q.task_done()
+
+    def _ensure_playback_thread(self) -> None:
+        if self._playback_thread is None or not self._playback_thread.is_alive():
+            self._playback_thread = threading.Thread(target=self._playback_loop, daemon=True)
+            self._playback_thread.start()
+
+    @staticmethod
+    def _gtts_lang(lang: str) -> str:
+        # Map language codes for gTTS: 'hi' and 'mr' are supported
+        if lang in ("hi", "mr"):
+            return lang
+        return "en"
+
+    def _prerender_canned(self) -> None:
+        # Runs in the background: starts the offline engine, and only when it can't be used are
+        # the canned replies synthesized with gTTS. That also opens the gTTS connection (DNS + TLS)
+        # early, since every reply will then go online.
+        if self._ensure_offline_engine():
+            return
+        for phrase, phrase_lang in CANNED_PHRASES + CANNED_PREFIXES:
+            self._synth_pool.submit(self._cache_phrase, phrase, phrase_lang)
+
+    def _cache_phrase(self, text: str, gtts_lang: str) -> None:
+        self._audio_cache[(text, gtts_lang)] = self._synthesize(text, gtts_lang).getvalue()
+
+    def _cached(self, text: str, gtts_lang: str) -> Optional[Future]:
+        data = self._audio_cache.get((text, gtts_lang))
+        if data is None:
+            return None
+        fut: Future = Future()
+        fut.set_result(BytesIO(data))
+        return fut
+
+    def _clause_futures(self, clause: str, gtts_lang: str) -> List[Future]:
+        cached = self._cached(clause, gtts_lang)
+        if cached is not None:
+            return [cached]
+        # e.g. "The current time is 10:30 PM." -> cached prefix + synthesize only the time
+        for prefix, prefix_lang in CANNED_PREFIXES:
+            if prefix_lang == gtts_lang and clause.startswith(prefix):
+                cached = self._cached(prefix, gtts_lang)
+                rest = clause[len(prefix):].strip()
+                if cached is not None and rest:
+                    return [cached, self._synth_pool.submit(self._synthesize, rest, gtts_lang)]
+        return [self._synth_pool.submit(self._synthesize, clause, gtts_lang)]
+
+    def speak_cached(self, text: str, lang: str = "en") -> bool:
+        """
+        Play text straight from the pre-rendered cache if every clause of it is cached.
+        Returns False (and plays nothing) otherwise.
+        """
+        gtts_lang = self._gtts_lang(lang)
+        clauses = split_clauses(text)
+        futures = [self._cached(clause, gtts_lang) for clause in clauses]
+        if not futures or any(f is None for f in futures):
+            return False
+        self._ensure_playback_thread()
+        for fut in futures:
+            self._playback_q.put(fut)
+        return True
+
+    def speak_online_chunk(self, clause: str, lang: str = "en") -> None:
+        """
+        Queue one already-split clause for synthesis + playback, behind anything queued before it.
+        """
+        gtts_lang = self._gtts_lang(lang)
+        self._ensure_playback_thread()
+        for fut in self._clause_futures(clause, gtts_lang):
+            self._playback_q.put(fut)
+
+    def speak_online(self, text: str, lang: str = "en") -> bool:
+        """
+        Use gTTS to synthesize each clause concurrently and queue them for playback.
+        Returns True if the reply was queued, False otherwise.
+        """
+        try:
+            clauses = split_clauses(text)
+            if not clauses:
+                return False
+            for clause in clauses:
+                self.speak_online_chunk(clause, lang)
             return True
         except Exception:
             return False
@@ -92,67 +379,271 @@ class VoiceAssistant:
     Main assistant class: handles listening, speaking, command execution, and delegating to the NLP model.
     """
 
-    def __init__(self) -> None:
+    # intent tag (see nlp_model.INTENTS) -> handler method; _tell_time also takes the language
+    _COMMANDS = {
+        "whatsapp": "_open_whatsapp",
+        "youtube": "_open_youtube",
+        "time": "_tell_time",
+        "music": "_play_music",
+    }
+
+    def __init__(self, warmup: bool = True) -> None:
         self.recognizer = sr.Recognizer()
+        self._recognize_pool = ThreadPoolExecutor(max_workers=len(RECOGNITION_LANGS))
+        # Microphone stream is opened on first listen and kept open afterwards
+        self._mic = None
+        self._mic_source = None
+        self._mic_lock = threading.Lock()
+        self._recalibrate_thread: Optional[threading.Thread] = None
+        # local faster-whisper model, loaded on first listen so text-only sessions never pay for it
+        self._stt = None
+        self._stt_failed = False
+        self._stt_lock = threading.Lock()
         self.tts = TTSManager()
-        self.nlp = MultilingualNLP()
+        # NLP models are heavy; build them on first access (see the `nlp` property) or in the warmup thread
+        self._nlp: Optional[MultilingualNLP] = None
+        self._nlp_lock = threading.Lock()
         # A very small persistent memory file to store last N interactions
         self.memory_file = os.path.join(os.path.dirname(__file__), "memory.json")
         self.memory_limit = 6
         self._ensure_memory_file()
+        self._history = self._load_memory()
+        self._memory_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        if warmup:
+            # Load + warm the models off the UI thread so the first real query doesn't pay for it
+            threading.Thread(target=self._warmup_nlp, daemon=True).start()
+
+    @property
+    def nlp(self) -> MultilingualNLP:
+        with self._nlp_lock:
+            if self._nlp is None:
+                self._nlp = MultilingualNLP()
+            return self._nlp
+
+    def _warmup_nlp(self) -> None:
+        try:
+            self.nlp.warmup()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _detect(text: str) -> str:
+        # Cached, model-free language detection; does not force the NLP models to load
+        return detect_language(text)
 
     def _ensure_memory_file(self):
         if not os.path.exists(self.memory_file):
             with open(self.memory_file, "w", encoding="utf-8") as f:
                 json.dump({"history": []}, f)
 
+    def _load_memory(self) -> "collections.deque":
+        try:
+            with open(self.memory_file, "rb") as f:
+                history = _json_loads(f.read()).get("history", [])
+        except Exception:
+            history = []
+        return collections.deque(history, maxlen=self.memory_limit)
+
+    def get_memory(self) -> List[dict]:
+        """Return a copy of the short persisted history (oldest first)."""
+        with self._memory_lock:
+            return list(self._history)
+
     def _append_memory(self, role: str, text: str):
+        # The deque is the source of truth; disk writes are coalesced into one delayed flush
+        with self._memory_lock:
+            self._history.append({"role": role, "text": text, "ts": int(time.time())})
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(0.5, self._flush_memory)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_memory(self):
+        with self._memory_lock:
+            self._flush_timer = None
+            data = {"history": list(self._history)}
+        tmp_path = self.memory_file + ".tmp"
         try:
-            with open(self.memory_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(tmp_path, "wb") as f:
+                f.write(_json_dumps(data, indent=True))
+            os.replace(tmp_path, self.memory_file)
         except Exception:
-            data = {"history": []}
-        history = data.get("history", [])
-        history.append({"role": role, "text": text, "ts": int(time.time())})
-        # keep only the last memory_limit entries
-        history = history[-self.memory_limit:]
-        data["history"] = history
-        with open(self.memory_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            pass
 
-    def listen_once(self, timeout: int = 6, phrase_time_limit: int = 12) -> Tuple[str, Optional[str]]:
+    def _ensure_mic_open(self):
         """
-        Listen via microphone once. Try Hindi, Marathi, then English recognition to improve capture.
-        Returns (transcribed_text, detected_language_code) or ("", None) on failure.
+        Open the microphone once and keep the stream for later calls. Without VAD, ambient
+        noise is calibrated on first open and then periodically by a background thread.
+        Must be called with _mic_lock held.
         """
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=0.6)
+        if self._mic_source is None:
+            if webrtcvad is not None:
+                # VAD end-pointing needs 16-bit mono at a fixed rate in 30 ms frames; no calibration
+                self._mic = sr.Microphone(sample_rate=VAD_SAMPLE_RATE, chunk_size=VAD_FRAME_SAMPLES)
+                self._mic_source = self._mic.__enter__()
+                return self._mic_source
+            self._mic = sr.Microphone()
+            self._mic_source = self._mic.__enter__()
+            self.recognizer.adjust_for_ambient_noise(self._mic_source, duration=0.6)
+            if self._recalibrate_thread is None:
+                self._recalibrate_thread = threading.Thread(target=self._recalibrate_loop, daemon=True)
+                self._recalibrate_thread.start()
+        return self._mic_source
+
+    def _close_mic(self) -> None:
+        if self._mic is not None:
             try:
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+                self._mic.__exit__(None, None, None)
             except Exception:
-                return "", None
-        # Try recognition in three language fallbacks
-        text = ""
-        for lang in ("hi-IN", "mr-IN", "en-US"):
+                pass
+        self._mic = None
+        self._mic_source = None
+
+    def _recalibrate_loop(self) -> None:
+        while True:
+            time.sleep(MIC_RECALIBRATE_SECS)
+            # skip this round if a listen is in progress
+            if not self._mic_lock.acquire(blocking=False):
+                continue
             try:
-                text = self.recognizer.recognize_google(audio, language=lang)
+                if self._mic_source is not None:
+                    self.recognizer.adjust_for_ambient_noise(self._mic_source, duration=0.6)
+            except Exception:
+                self._close_mic()
+            finally:
+                self._mic_lock.release()
+
+    def _listen_vad(self, source, timeout: int, phrase_time_limit: int) -> "sr.AudioData":
+        """
+        Capture one utterance using webrtcvad: start on the first speech frame (keeping a short
+        pre-roll so the onset isn't clipped) and stop after VAD_END_SILENCE_FRAMES of silence.
+        """
+        vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+        frame_secs = source.CHUNK / source.SAMPLE_RATE
+        preroll: "collections.deque[bytes]" = collections.deque(maxlen=VAD_PREROLL_FRAMES)
+        frames: List[bytes] = []
+        waited = 0.0
+        silence = 0
+        while True:
+            frame = source.stream.read(source.CHUNK)
+            speech = vad.is_speech(frame, source.SAMPLE_RATE)
+            if not frames:
+                preroll.append(frame)
+                if speech:
+                    frames.extend(preroll)
+                    continue
+                waited += frame_secs
+                if timeout and waited > timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                continue
+            frames.append(frame)
+            silence = 0 if speech else silence + 1
+            if silence >= VAD_END_SILENCE_FRAMES:
+                break
+            if phrase_time_limit and len(frames) * frame_secs >= phrase_time_limit:
+                break
+        return sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def _ensure_stt(self):
+        with self._stt_lock:
+            if self._stt is None and not self._stt_failed and WhisperModel is not None:
+                try:
+                    self._stt = WhisperModel(WHISPER_MODEL, device="auto", compute_type="int8")
+                except Exception:
+                    # don't retry on every utterance; Google recognition is used instead
+                    self._stt_failed = True
+            return self._stt
+
+    def _transcribe_local(self, audio: "sr.AudioData") -> Tuple[Optional[str], Optional[str]]:
+        """
+        Transcribe with the local faster-whisper model: one pass, language identified by the model.
+        Returns (text, language_code), or (None, None) if the model is unavailable, fails, or hears
+        a language we don't support, so the caller can fall back to Google recognition.
+        """
+        model = self._ensure_stt()
+        if model is None:
+            return None, None
+        raw = audio.get_raw_data(convert_rate=WHISPER_SAMPLE_RATE, convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768
+        try:
+            segments, info = model.transcribe(samples, language=None, vad_filter=True)
+            # segments is lazy; decoding happens while joining
+            text = " ".join(s.text.strip() for s in segments).strip()
+        except Exception:
+            return None, None
+        if info.language not in SUPPORTED_LANGS:
+            return None, None
+        return text, info.language
+
+    def _recognize_any(self, audio: "sr.AudioData") -> str:
+        """
+        Run Hindi, Marathi and English recognition concurrently and return the first non-empty transcript.
+        """
+        # recognize_google FLAC-encodes the clip on every call; encode once and share it across the requests
+        audio.get_flac_data = functools.lru_cache(maxsize=None)(audio.get_flac_data)
+        audio.get_flac_data(convert_rate=None if audio.sample_rate >= 8000 else 8000, convert_width=2)
+
+        pending = {
+            self._recognize_pool.submit(self.recognizer.recognize_google, audio, language=lang)
+            for lang in RECOGNITION_LANGS
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    text = fut.result()
+                except Exception:
+                    continue
                 if text:
-                    break
+                    for other in pending:
+                        other.cancel()
+                    return text
+        return ""
+
+    def listen_once(self, timeout: int = 6, phrase_time_limit: int = 12) -> Tuple[str, Optional[str]]:
+        """
+        Listen via microphone once. Transcribed locally with faster-whisper when it is installed;
+        otherwise Hindi, Marathi and English Google recognition run in parallel.
+        Returns (transcribed_text, detected_language_code) or ("", None) on failure.
+        """
+        with self._mic_lock:
+            try:
+                source = self._ensure_mic_open()
+                if webrtcvad is not None:
+                    audio = self._listen_vad(source, timeout, phrase_time_limit)
+                else:
+                    audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+            except sr.WaitTimeoutError:
+                return "", None
             except Exception:
-                text = ""
+                # the stream may be dead (device unplugged etc.); reopen on the next call
+                self._close_mic()
+                return "", None
+        text, lang_code = self._transcribe_local(audio)
+        if text is None:
+            text = self._recognize_any(audio)
         if not text:
             return "", None
-        # detect language code using langdetect (may be 'hi', 'mr', 'en')
-        try:
-            lang_code = self.nlp.detect_language(text)
-        except Exception:
-            lang_code = "en"
+        if lang_code is None:
+            # detect language code using langdetect (may be 'hi', 'mr', 'en')
+            try:
+                lang_code = self._detect(text)
+            except Exception:
+                lang_code = "en"
         return text, lang_code
 
     def speak(self, text: str, lang: str = "en") -> None:
         """
-        Speak text using offline engine first; if that fails, fallback to online gTTS.
+        Speak text from the pre-rendered cache if possible, else offline engine first;
+        if that fails, fallback to online gTTS.
         """
+        # Fixed command replies are pre-rendered; replay them without any synthesis
+        try:
+            if self.tts.speak_cached(text, lang=lang):
+                return
+        except Exception:
+            pass
         spoken = False
         try:
             spoken = self.tts.speak_offline(text)
@@ -165,6 +656,21 @@ class VoiceAssistant:
                 # If both fail, just print
                 print("BestBuddy (TTS failed):", text)
 
+    def speak_chunk(self, clause: str, lang: str = "en") -> None:
+        """
+        Speak one clause of a streamed reply, queued behind the clauses before it.
+        Unlike speak(), nothing queued this way is ever dropped.
+        """
+        try:
+            if self.tts.speak_offline(clause, drop_stale=False):
+                return
+        except Exception:
+            pass
+        try:
+            self.tts.speak_online_chunk(clause, lang=lang)
+        except Exception:
+            print("BestBuddy (TTS failed):", clause)
+
     # ----- Task / Command Implementations -----
     def _open_whatsapp(self) -> str:
         try:
@@ -223,61 +729,96 @@ class VoiceAssistant:
         """
         if not text:
             return None
-        q = text.lower()
-
-        # WhatsApp
-        if any(kw in q for kw in ["open whatsapp", "whatsapp", "व्हाट्सअॅप", "व्हाट्सएप", "व्हाट्सॅप", "व्हाट्सअप"]):
-            return self._open_whatsapp()
+        # lower() is the same as casefold() for ASCII and a little cheaper
+        q = text.lower() if text.isascii() else text.casefold()
 
-        # YouTube
-        if any(kw in q for kw in ["open youtube", "youtube", "यूट्यूब"]):
-            return self._open_youtube()
-
-        # Time
-        if any(kw in q for kw in ["what's the time", "time", "समय", "वेळ", "कितना बजे", "कितने बजे", "आत्ता वेळ"]):
-            return self._tell_time(lang or "en")
-
-        # Play music
-        if any(kw in q for kw in ["play music", "play song", "music", "संगीत", "गाना", "गाणी"]):
-            return self._play_music()
+        best = match_intent(q)
+        if best is not None:
+            handler = getattr(self, self._COMMANDS[best])
+            if best == "time":
+                return handler(lang or self._detect(text))
+            return handler()
 
         # Open URL pattern (contains dot)
-        tokens = q.split()
-        for tok in tokens:
-            if "." in tok and len(tok) > 3:
-                return self._open_website(tok)
+        m = _URL_RE.search(q)
+        if m:
+            return self._open_website(m.group(0))
 
         # Could not find a command
         return None
 
     # ----- Main answer flow -----
-    def answer(self, text: str) -> Tuple[str, str]:
+    def _command_reply(self, text: str, user_lang: str) -> Optional[Tuple[str, str]]:
+        """
+        Run command matching before anything else. The NLP models are only touched if the
+        reply must be translated. Returns (reply_text, language_code) or None if the text is
+        not a command.
+        """
+        cmd_result = self.handle_command(text, user_lang)
+        if not cmd_result:
+            return None
+        # translate command response to user's language if needed using nlp
+        reply = cmd_result
+        # if reply is in English but user_lang not en, try translating
+        if user_lang != "en":
+            reply = self.nlp.translate_short(reply, user_lang)
+        # store memory
+        self._append_memory("assistant", reply)
+        return reply, user_lang
+
+    def answer(self, text: str, lang: Optional[str] = None) -> Tuple[str, str]:
         """
         Returns (reply_text, language_code)
         1. Try command execution first
         2. Otherwise use the NLP model to answer in user's language
+        lang is the language already detected for text (e.g. by listen_once); detected here if omitted.
         """
         if not text:
             return "माफ करा, मी समजत नाही. कृपया पुन्हा बोलावं.", "hi"
-
-        # detect language
-        user_lang = self.nlp.detect_language(text)
+        # detected once and passed down; nothing below detects again
+        lang = lang or self._detect(text)
 
         # try commands first
-        cmd_result = self.handle_command(text, user_lang)
-        if cmd_result:
-            # translate command response to user's language if needed using nlp
-            reply = cmd_result
-            # if reply is in English but user_lang not en, try translating
-            if user_lang != "en":
-                reply = self.nlp.translate_from_en(reply, user_lang)
-            # store memory
-            self._append_memory("assistant", reply)
-            return reply, user_lang
+        cmd = self._command_reply(text, lang)
+        if cmd:
+            return cmd
 
         # fallback to general QA
         # Save user input to memory for context
         self._append_memory("user", text)
-        reply, lang = self.nlp.answer_in_user_language(text)
+        reply, lang = self.nlp.answer_in_user_language(text, src_lang=lang)
         self._append_memory("assistant", reply)
         return reply, lang
+
+    def answer_streaming(self, text: str) -> Iterator[str]:
+        """
+        Streaming variant of answer(): yields the reply clause by clause and starts speaking
+        each clause as soon as it is available, instead of waiting for the whole reply.
+        """
+        if not text:
+            reply, lang = self.answer(text)
+            self.speak(reply, lang=lang)
+            yield reply
+            return
+
+        user_lang = self._detect(text)
+        cmd = self._command_reply(text, user_lang)
+        if cmd:
+            reply, user_lang = cmd
+            self.speak(reply, lang=user_lang)
+            yield reply
+            return
+
+        self._append_memory("user", text)
+        parts = []
+        for segment in self.nlp.stream_answer(text, src_lang=user_lang):
+            parts.append(segment)
+            clause = segment.strip()
+            if clause:
+                self.speak_chunk(clause, lang=user_lang)
+            yield segment
+        self._append_memory("assistant", "".join(parts).strip())
+
+
+# Older versions of app.py import the assistant under this name
+BestBuddyAssistant = VoiceAssistant
@@ -1,23 +1,495 @@
 # nlp_model.py
 import os
+import re
+import collections
 import json
+import functools
+import queue
+import threading
 import time
-from typing import Tuple, Optional
+from concurrent.futures import Future
+from typing import Iterator, List, Tuple, Optional
+
+# CPU threading must be configured before torch (and its OpenMP/MKL runtimes) is imported.
+# Half the logical cores for intra-op work avoids oversubscription on short decode steps;
+# values already set in the environment win.
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+os.environ.setdefault("MKL_NUM_THREADS", os.environ["OMP_NUM_THREADS"])
 
 import torch
-from transformers import pipeline
+import torch.nn.functional as F
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, TextIteratorStreamer, pipeline
+from transformers.modeling_outputs import BaseModelOutput
 from langdetect import detect, LangDetectException
 
+try:
+    # optional: ONNX Runtime + int8 quantization for CPU inference
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ORTModelForSeq2SeqLM = None
+
+try:
+    import orjson  # optional: faster JSON for the memory files (also used by assistant.py)
+except ImportError:
+    orjson = None
+
+try:
+    from optimum.bettertransformer import BetterTransformer  # optional: fused attention kernels
+except ImportError:
+    BetterTransformer = None
+
+try:
+    import ahocorasick  # optional: multi-pattern keyword automaton (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
+try:
+    import intel_extension_for_pytorch as ipex  # optional: oneDNN / AVX-512 CPU kernels
+except ImportError:
+    ipex = None
+
+torch.backends.mkldnn.enabled = True
+try:
+    torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+    torch.set_num_interop_threads(2)
+except (RuntimeError, ValueError):
+    # interop threads can only be set before torch runs any parallel work
+    pass
+
+# Supported language mapping
+SUPPORTED_LANGS = {"en": "english", "hi": "hindi", "mr": "marathi"}
+
 # Models we attempt to use (downloaded via HF automatically)
-GENERATION_MODEL = "google/flan-t5-base"      # primary (text2text)
+# Generator size per quality setting; "fast" (~60M params) is the default for CPU machines
+QUALITY_MODELS = {
+    "fast": "google/flan-t5-small",
+    "balanced": "google/flan-t5-base",
+    "best": "google/flan-t5-large",
+}
+DEFAULT_QUALITY = "fast"
+GENERATION_MODEL = os.environ.get("BB_GEN_MODEL", QUALITY_MODELS[DEFAULT_QUALITY])  # primary (text2text)
+BASE_GENERATION = QUALITY_MODELS["balanced"]  # tried if the selected model fails to load
 FALLBACK_GENERATION = "distilgpt2"            # fallback small generator
 EN_TO_INDIC = "ai4bharat/IndicTrans2-en-indic"
 INDIC_TO_EN = "ai4bharat/IndicTrans2-indic-en"
+# Distilled (~200M) translators, tried first in "fast" mode
+EN_TO_INDIC_DISTILLED = "ai4bharat/indictrans2-en-indic-dist-200M"
+INDIC_TO_EN_DISTILLED = "ai4bharat/indictrans2-indic-en-dist-200M"
+
+# Exported + int8-quantized ONNX models (built once, reused on later starts)
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bestbuddy", "onnx")
+
+# Short dummy inputs run once after each model loads (see MultilingualNLP._warm)
+WARMUP_EN = "warmup test sentence " * 3
+WARMUP_HI = "यह एक परीक्षण वाक्य है। " * 2
 
-MEMORY_PATH = os.path.join(os.path.dirname(__file__), "nlp_memory.json")
+MEMORY_PATH = os.path.join(os.path.dirname(__file__), "nlp_memory.jsonl")
+# Older versions kept the whole history in one JSON document; read once to seed the JSONL file
+LEGACY_MEMORY_PATH = os.path.join(os.path.dirname(__file__), "nlp_memory.json")
+# Persisted user preferences (currently just the quality setting)
+SETTINGS_PATH = os.path.join(os.path.dirname(__file__), "nlp_settings.json")
 # Keep short conversation memory in this model too (in-memory) as well as persisted
 SHORT_HISTORY_LIMIT = 6
 
+_DEVANAGARI_RE = re.compile("[\u0900-\u097F]")
+# Letters Hindi doesn't use (ळ ऱ ऴ) plus a few very common Marathi-only words. The words must
+# stand alone (not inside e.g. Hindi कायम / कायदा), so they may not touch another Devanagari
+# letter or sign; the danda and digits still count as a boundary.
+_DEVANAGARI_LETTER = "[\u0900-\u0963\u0971-\u097F]"
+_MARATHI_RE = re.compile(f"[ळऱऴ]|(?<!{_DEVANAGARI_LETTER})(?:आहे|नाही|काय)(?!{_DEVANAGARI_LETTER})")
+# Sentence / clause boundaries, including the Devanagari danda (।). A terminator only ends a
+# clause when followed by whitespace or the end of the text, so "3.10" and "docs.python.org" stay whole.
+CLAUSE_RE = re.compile(r"(?:[^.!?।]|[.!?।](?!\s|$))+[.!?।]+(?=\s|$)")
+
+
+def _has_devanagari(text: str) -> bool:
+    # isascii() and the regex both scan in C, unlike a per-character generator
+    return not text.isascii() and _DEVANAGARI_RE.search(text) is not None
+
+
+def _json_loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def _json_dumps(obj, indent: bool = False) -> bytes:
+    # Same on-disk format either way: UTF-8, non-ASCII kept as-is, compact or 2-space indent
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+def _dumps_line(entry: dict) -> bytes:
+    return _json_dumps(entry) + b"\n"
+
+
+def split_clauses(text: str) -> List[str]:
+    """
+    Split a reply into sentence-sized chunks so each one can be synthesized separately.
+    Any trailing text without a terminating punctuation mark is kept as the last chunk.
+    """
+    clauses = []
+    end = 0
+    for m in CLAUSE_RE.finditer(text):
+        clauses.append(m.group(0).strip())
+        end = m.end()
+    clauses.append(text[end:].strip())
+    return [c for c in clauses if c]
+
+
+def _gpu_dtype() -> "torch.dtype":
+    """Half precision on tensor-core GPUs: bf16 on Ampere+ (sm_80), fp16 on Volta/Turing (sm_70)."""
+    major, _ = torch.cuda.get_device_capability()
+    if major >= 8:
+        return torch.bfloat16
+    if major >= 7:
+        return torch.float16
+    return torch.float32
+
+
+def _optimize_model(model):
+    """
+    Best-effort eager-mode speedups for a loaded PyTorch model: BetterTransformer fused attention
+    kernels, Intel Extension for PyTorch on CPU (bf16 weights with BB_CPU_BF16=1, for CPUs with
+    AVX-512 BF16), then, opt-in with BB_TORCH_COMPILE=1, torch.compile on forward. Each step is
+    skipped if the architecture or installed versions don't support it.
+    """
+    if BetterTransformer is not None:
+        try:
+            model = BetterTransformer.transform(model)
+        except Exception:
+            pass
+    if ipex is not None and getattr(model, "device", None) is not None and model.device.type == "cpu":
+        dtype = torch.bfloat16 if os.environ.get("BB_CPU_BF16") == "1" else torch.float32
+        try:
+            model = ipex.optimize(model.eval(), dtype=dtype)
+        except Exception:
+            pass
+    # Off by default: input length changes on every query and decode step, so the first real
+    # queries would pay for recompiles that the short warmup can't cover
+    if hasattr(torch, "compile") and os.environ.get("BB_TORCH_COMPILE") == "1":
+        eager_forward = model.forward
+        try:
+            # dynamic shapes, and no CUDA graphs (mode="reduce-overhead" re-records them per shape)
+            model.forward = torch.compile(model.forward, dynamic=True, fullgraph=False)
+            # kept so _warm can undo the compile if it fails on first run
+            model._eager_forward = eager_forward
+        except Exception:
+            model.forward = eager_forward
+    return model
+
+
+def _build_ort_pipeline(task: str, model_id: str):
+    """
+    Build a CPU pipeline backed by a dynamically int8-quantized ONNX Runtime export of model_id.
+    The export + quantization is done once and cached under ONNX_CACHE_DIR.
+    Returns None if optimum/onnxruntime isn't installed; raises if the model can't be exported.
+    """
+    if ORTModelForSeq2SeqLM is None:
+        return None
+    name = model_id.replace("/", "--")
+    quant_dir = os.path.join(ONNX_CACHE_DIR, name + "-int8")
+    file_names = {
+        "encoder_file_name": "encoder_model_quantized.onnx",
+        "decoder_file_name": "decoder_model_quantized.onnx",
+        "decoder_with_past_file_name": "decoder_with_past_model_quantized.onnx",
+    }
+    if not os.path.exists(os.path.join(quant_dir, file_names["encoder_file_name"])):
+        export_dir = os.path.join(ONNX_CACHE_DIR, name)
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            model_id, export=True, use_merged=False, provider="CPUExecutionProvider"
+        )
+        model.save_pretrained(export_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+        for onnx_file in ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx"):
+            quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=onnx_file)
+            quantizer.quantize(save_dir=quant_dir, quantization_config=qconfig)
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(quant_dir)
+    model = ORTModelForSeq2SeqLM.from_pretrained(quant_dir, provider="CPUExecutionProvider", **file_names)
+    tokenizer = AutoTokenizer.from_pretrained(quant_dir)
+    return pipeline(task, model=model, tokenizer=tokenizer)
+
+
+# Command keywords per intent, in priority order (English + Hindi/Marathi).
+# Shared by VoiceAssistant.handle_command and MultilingualNLP.detect_intent.
+INTENTS = {
+    "whatsapp": ["open whatsapp", "whatsapp", "व्हाट्सअॅप", "व्हाट्सएप", "व्हाट्सॅप", "व्हाट्सअप", "व्हाट्स"],
+    "youtube": ["open youtube", "youtube", "यूट्यूब"],
+    "time": ["what's the time", "time", "समय", "वेळ", "कितना बजे", "कितने बजे", "आत्ता वेळ"],
+    "music": ["play music", "play song", "music", "संगीत", "गाना", "गाणी", "गाण"],
+}
+_INTENT_ORDER = {tag: i for i, tag in enumerate(INTENTS)}
+_INTENT_RE = re.compile(
+    "|".join(f"(?P<{tag}>{'|'.join(map(re.escape, kws))})" for tag, kws in INTENTS.items())
+)
+
+
+def _build_intent_automaton():
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for tag, kws in INTENTS.items():
+        for kw in kws:
+            automaton.add_word(kw.casefold(), tag)
+    automaton.make_automaton()
+    return automaton
+
+
+_INTENT_AC = _build_intent_automaton()
+
+
+def match_intent(q: str) -> Optional[str]:
+    """
+    Return the intent tag for a casefolded query, or None.
+    One scan for every keyword; when several intents match, the earlier INTENTS entry wins.
+    """
+    if _INTENT_AC is not None:
+        tags = (tag for _, tag in _INTENT_AC.iter(q))
+    else:
+        tags = (m.lastgroup for m in _INTENT_RE.finditer(q))
+    best = None
+    for tag in tags:
+        rank = _INTENT_ORDER[tag]
+        if best is None or rank < _INTENT_ORDER[best]:
+            best = tag
+            if rank == 0:
+                break
+    return best
+
+
+def detect_language(text: str) -> str:
+    """
+    Return 'en', 'hi', or 'mr' (or 'en' fallback).
+    The script decides most inputs without a statistical model: pure ASCII is English and
+    Devanagari in the first 32 characters is Hindi/Marathi. Only mixed input goes to langdetect.
+    Results are cached on the first 64 characters.
+    """
+    if not text or not text.strip():
+        return "en"
+    return _detect_language_prefix(text[:64])
+
+
+@functools.lru_cache(maxsize=256)
+def _detect_language_prefix(text: str) -> str:
+    if text.isascii():
+        return "en"
+    if _has_devanagari(text[:32]):
+        return "mr" if _MARATHI_RE.search(text) else "hi"
+    try:
+        code = detect(text)
+        if code in ("en", "hi", "mr"):
+            return code
+        # If detection returned 'hi'/'mr' variants or others, fall back
+        if code.startswith("hi"):
+            return "hi"
+        if code.startswith("mr"):
+            return "mr"
+        # Heuristic: Devanagari script implies hi or mr
+        if _has_devanagari(text):
+            return "hi"
+        return "en"
+    except LangDetectException:
+        # fallback heuristics
+        if _has_devanagari(text):
+            return "hi"
+        return "en"
+
+
+class DynamicBatcher:
+    """
+    Collects concurrent single-text calls to a pipeline for up to `timeout_ms`, sorts them by
+    token length and runs one pipeline call per length bucket, so padding is only added between
+    inputs of similar length. Results are handed back through Futures.
+    """
+
+    def __init__(self, pipe, max_batch: int = 16, timeout_ms: int = 15, max_bucket: int = 32,
+                 max_len_spread: int = 8, **call_kwargs):
+        self.pipe = pipe
+        self.max_batch = max_batch
+        self.timeout = timeout_ms / 1000.0
+        self.max_bucket = max_bucket
+        self.max_len_spread = max_len_spread
+        self.call_kwargs = call_kwargs
+        self._q: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._q.put((text, fut))
+        return fut
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        items = [self._q.get()]
+        deadline = time.monotonic() + self.timeout
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _token_len(self, text: str) -> int:
+        tokenizer = getattr(self.pipe, "tokenizer", None)
+        if tokenizer is None:
+            return len(text.split())
+        return len(tokenizer(text, padding=False).input_ids)
+
+    def _buckets(self, items: List[Tuple[str, Future]]) -> Iterator[List[int]]:
+        lengths = [self._token_len(text) for text, _ in items]
+        bucket: List[int] = []
+        for i in sorted(range(len(items)), key=lengths.__getitem__):
+            if bucket and (len(bucket) >= self.max_bucket or lengths[i] - lengths[bucket[0]] > self.max_len_spread):
+                yield bucket
+                bucket = []
+            bucket.append(i)
+        if bucket:
+            yield bucket
+
+    def _loop(self) -> None:
+        # This is the only worker thread: nothing may escape the loop, or every later
+        # submit() would wait forever
+        while True:
+            items = self._collect()
+            try:
+                self._run_batch(items)
+            except Exception as e:
+                # e.g. the tokenizer failed while bucketing; fail whatever is still unresolved
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _call(self, texts: list) -> list:
+        with torch.inference_mode():
+            return self.pipe(texts, batch_size=len(texts), **self.call_kwargs)
+
+    def _run_batch(self, items: List[Tuple[str, Future]]) -> None:
+        for bucket in self._buckets(items):
+            texts = [items[i][0] for i in bucket]
+            try:
+                outputs = self._call(texts)
+                for i, out in zip(bucket, outputs):
+                    items[i][1].set_result(out)
+            except Exception as e:
+                for i in bucket:
+                    if not items[i][1].done():
+                        items[i][1].set_exception(e)
+
+
+class EncodedBatcher(DynamicBatcher):
+    """
+    DynamicBatcher for generation from precomputed encoder states (see
+    MultilingualNLP._encoded_inputs). Each submitted item is a (hidden_states, attention_mask)
+    pair; a bucket is right-padded to its longest input (padding masked out) and decoded with
+    one model.generate() call. Results are {"generated_text": ...} like the pipeline's.
+    """
+
+    def _token_len(self, item) -> int:
+        return item[0].shape[1]
+
+    def _call(self, items: list) -> list:
+        width = max(hidden.shape[1] for hidden, _ in items)
+        hidden = torch.cat([F.pad(h, (0, 0, 0, width - h.shape[1])) for h, _ in items], dim=0)
+        mask = torch.cat([F.pad(m, (0, width - m.shape[1])) for _, m in items], dim=0)
+        with torch.inference_mode():
+            output_ids = self.pipe.model.generate(
+                encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                attention_mask=mask,
+                **self.call_kwargs,
+            )
+        texts = self.pipe.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+        return [{"generated_text": text} for text in texts]
+
+
+def _load_seq2seq(task: str, model_id: str, device: int):
+    # On CPU prefer the quantized ONNX Runtime build, else (or if export fails) plain PyTorch.
+    # On GPU load the weights in half precision.
+    if device == -1:
+        try:
+            ort_pipe = _build_ort_pipeline(task, model_id)
+            if ort_pipe is not None:
+                return ort_pipe
+        except Exception:
+            pass
+        pipe = pipeline(task, model=model_id, device=device)
+    else:
+        dtype = _gpu_dtype()
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_id, torch_dtype=dtype).to(f"cuda:{device}")
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        pipe = pipeline(task, model=model, tokenizer=tokenizer, device=device, torch_dtype=dtype)
+    pipe.model = _optimize_model(pipe.model)
+    return pipe
+
+
+def _warm(pipe, sample: str, device: int) -> None:
+    # One tiny inference right after loading so kernel selection / graph building (including
+    # torch.compile) and cold caches are paid here, not on the user's first real query
+    try:
+        with torch.inference_mode():
+            pipe(sample, max_new_tokens=8)
+        if device >= 0:
+            torch.cuda.synchronize()
+    except Exception:
+        # torch.compile only fails when first run; fall back to eager and try once more
+        model = getattr(pipe, "model", None)
+        eager_forward = getattr(model, "_eager_forward", None)
+        if eager_forward is None:
+            return
+        model.forward = eager_forward
+        del model._eager_forward
+        _warm(pipe, sample, device)
+
+
+def _load_first(task: str, model_ids: Tuple[str, ...], device: int):
+    # Try each model in order and return the first pipeline that loads
+    error: Optional[Exception] = None
+    for model_id in dict.fromkeys(model_ids):
+        try:
+            return _load_seq2seq(task, model_id, device)
+        except Exception as e:
+            error = e
+    raise error
+
+
+# Loaded models are shared by every MultilingualNLP in the process (e.g. one per Streamlit
+# session), so N assistants hold one copy of the weights instead of N. The factories below
+# must be called with that model's lock held so two threads never load the same model at once;
+# one lock per model, so a loaded model never waits behind another model's download/export.
+_MODEL_LOCKS = {
+    "generator": threading.Lock(),
+    "en_to_indic": threading.Lock(),
+    "indic_to_en": threading.Lock(),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_seq2seq(task: str, model_ids: Tuple[str, ...], device: int, sample: str, **batch_kwargs):
+    """
+    Return (pipeline, DynamicBatcher) for the first of model_ids that loads, warmed with sample.
+    Raises if none load; failures aren't cached, so the next call tries again.
+    """
+    pipe = _load_first(task, model_ids, device)
+    _warm(pipe, sample, device)
+    return pipe, DynamicBatcher(pipe, **batch_kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoded_batcher(pipe, **generate_kwargs) -> EncodedBatcher:
+    # one per generator pipeline (and generation settings), shared like the pipeline itself
+    return EncodedBatcher(pipe, **generate_kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_fallback_generator(device: int):
+    pipe = pipeline("text-generation", model=FALLBACK_GENERATION, device=device)
+    _warm(pipe, WARMUP_EN, device)
+    return pipe
+
 
 class MultilingualNLP:
     """
@@ -28,36 +500,154 @@ class MultilingualNLP:
     - short-term memory to provide context
     """
 
-    def __init__(self):
+    def __init__(self, quality: Optional[str] = None):
+        """
+        quality: "fast", "balanced" or "best" picks a small / base / large generator.
+        An explicit value is remembered for later runs; if omitted, the saved choice is used,
+        else BB_GEN_MODEL (or the "fast" model).
+        """
+        if quality is not None:
+            if quality not in QUALITY_MODELS:
+                raise ValueError(f"quality must be one of {sorted(QUALITY_MODELS)}")
+            self._save_quality(quality)
+        else:
+            quality = self._load_quality()
+        self.quality = quality
+        self.generation_model = QUALITY_MODELS[quality] if quality else GENERATION_MODEL
+
         # device selection: -1 CPU, 0+ GPU
         self.device = 0 if torch.cuda.is_available() else -1
+        # generation model lazy-loaded on first generate_answer()
         self.generator = None
         self.generation_task = None
-        self._load_generation_model()
+        self._generation_loaded = False
 
         # translation pipelines lazy-loaded
         self.en_to_indic = None
         self.indic_to_en = None
 
-        # short-term in-memory context
-        self.history = []
-        self._ensure_memory_file()
+        # request batchers, created alongside their pipelines
+        self._generate_batcher: Optional[DynamicBatcher] = None
+        # generation from cached encoder states (PyTorch seq2seq generators only)
+        self._encoded_batcher: Optional[EncodedBatcher] = None
+        self._en_to_indic_batcher: Optional[DynamicBatcher] = None
+        self._indic_to_en_batcher: Optional[DynamicBatcher] = None
 
-    def _ensure_memory_file(self):
+        # encoder states per history turn, reused across turns (see _encoded_inputs)
+        self._encoder_cache = {}
+        self._encoder_lock = threading.Lock()
+
+        # per-language flag: does the generator answer directly in that language? (see answer_direct)
+        self._direct_ok = {}
+
+        # short-term in-memory context (source of truth); disk is an append-only log
+        self.history = self._load_history()
+        self._persist_q: "queue.Queue[dict]" = queue.Queue()
+        threading.Thread(target=self._persist_loop, daemon=True).start()
+
+    @staticmethod
+    def _load_quality() -> Optional[str]:
+        try:
+            with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+                quality = json.load(f).get("quality")
+        except Exception:
+            return None
+        return quality if quality in QUALITY_MODELS else None
+
+    @staticmethod
+    def _save_quality(quality: str) -> None:
+        try:
+            with open(SETTINGS_PATH, "w", encoding="utf-8") as f:
+                json.dump({"quality": quality}, f)
+        except Exception:
+            pass
+
+    def _load_history(self) -> List[dict]:
+        """
+        Return the last SHORT_HISTORY_LIMIT entries of the JSONL log, seeding it from the legacy
+        JSON file on first run. The log is compacted here if it has grown large.
+        """
         if not os.path.exists(MEMORY_PATH):
-            with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-                json.dump({"history": []}, f)
+            try:
+                with open(LEGACY_MEMORY_PATH, "r", encoding="utf-8") as f:
+                    seed = json.load(f).get("history", [])[-SHORT_HISTORY_LIMIT:]
+            except Exception:
+                seed = []
+            self._rewrite_log(seed)
+            return seed
+        line_count = 0
+        tail: "collections.deque[bytes]" = collections.deque(maxlen=SHORT_HISTORY_LIMIT)
+        try:
+            with open(MEMORY_PATH, "rb") as f:
+                for line in f:
+                    line_count += 1
+                    tail.append(line)
+            history = [_json_loads(line) for line in tail if line.strip()]
+        except Exception:
+            history = []
+        if line_count > SHORT_HISTORY_LIMIT * 20:
+            self._rewrite_log(history)
+        return history
+
+    @staticmethod
+    def _rewrite_log(entries: List[dict]) -> None:
+        tmp_path = MEMORY_PATH + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for entry in entries:
+                    f.write(_dumps_line(entry))
+            os.replace(tmp_path, MEMORY_PATH)
+        except Exception:
+            pass
+
+    def _persist_loop(self) -> None:
+        # Single writer: append each entry as one JSON line, off the request path
+        while True:
+            entry = self._persist_q.get()
+            try:
+                with open(MEMORY_PATH, "ab") as f:
+                    f.write(_dumps_line(entry))
+            except Exception:
+                pass
+
+    def warmup(self) -> None:
+        """Load and warm the generator and both translators (meant to run on a background thread)."""
+        self._ensure_generator()
+        self._ensure_indic_to_en()
+        self._ensure_en_to_indic()
+
+    def _translation_candidates(self, full: str, distilled: str) -> Tuple[str, ...]:
+        if self.quality == "fast" or (self.quality is None and self.generation_model == QUALITY_MODELS["fast"]):
+            return distilled, full
+        return (full,)
+
+    # The _ensure_* methods check the loaded state before taking the (per-model) lock, so calls
+    # after the first load never block, even while the warmup thread loads another model.
+    def _ensure_generator(self):
+        if self._generation_loaded:
+            return
+        with _MODEL_LOCKS["generator"]:
+            if self._generation_loaded:
+                return
+            self._load_generation_model()
+            self._generation_loaded = True
 
     def _load_generation_model(self):
-        # Try to load flan-t5 first (text2text). If fails, fallback to distilgpt2.
+        # Try the selected flan-t5 first, then flan-t5-base (text2text). If both fail, fallback to distilgpt2.
         try:
-            self.generator = pipeline("text2text-generation", model=GENERATION_MODEL, device=self.device)
             self.generation_task = "text2text-generation"
+            self.generator, self._generate_batcher = _get_seq2seq(
+                "text2text-generation", (self.generation_model, BASE_GENERATION), self.device, WARMUP_EN,
+                **self._generation_kwargs(),
+            )
+            if self._can_reuse_encoder():
+                self._encoded_batcher = _get_encoded_batcher(self.generator, **self._generation_kwargs())
         except Exception:
             try:
                 # fallback
-                self.generator = pipeline("text-generation", model=FALLBACK_GENERATION, device=self.device)
+                self._encoded_batcher = None
                 self.generation_task = "text-generation"
+                self.generator = _get_fallback_generator(self.device)
             except Exception:
                 self.generator = None
                 self.generation_task = None
@@ -65,41 +655,40 @@ class MultilingualNLP:
     def _ensure_en_to_indic(self):
         if self.en_to_indic is not None:
             return
-        try:
-            self.en_to_indic = pipeline("translation", model=EN_TO_INDIC, device=self.device)
-        except Exception:
-            self.en_to_indic = None
+        with _MODEL_LOCKS["en_to_indic"]:
+            if self.en_to_indic is not None:
+                return
+            try:
+                pipe, batcher = _get_seq2seq(
+                    "translation", self._translation_candidates(EN_TO_INDIC, EN_TO_INDIC_DISTILLED),
+                    self.device, WARMUP_EN,
+                )
+            except Exception:
+                return
+            # batcher first: en_to_indic being set is what lock-free readers check
+            self._en_to_indic_batcher = batcher
+            self.en_to_indic = pipe
 
     def _ensure_indic_to_en(self):
         if self.indic_to_en is not None:
             return
-        try:
-            self.indic_to_en = pipeline("translation", model=INDIC_TO_EN, device=self.device)
-        except Exception:
-            self.indic_to_en = None
+        with _MODEL_LOCKS["indic_to_en"]:
+            if self.indic_to_en is not None:
+                return
+            try:
+                pipe, batcher = _get_seq2seq(
+                    "translation", self._translation_candidates(INDIC_TO_EN, INDIC_TO_EN_DISTILLED),
+                    self.device, WARMUP_HI,
+                )
+            except Exception:
+                return
+            # batcher first: indic_to_en being set is what lock-free readers check
+            self._indic_to_en_batcher = batcher
+            self.indic_to_en = pipe
 
     def detect_language(self, text: str) -> str:
         """Return 'en', 'hi', or 'mr' (or 'en' fallback)"""
-        if not text or not text.strip():
-            return "en"
-        try:
-            code = detect(text)
-            if code in ("en", "hi", "mr"):
-                return code
-            # If detection returned 'hi'/'mr' variants or others, fall back
-            if code.startswith("hi"):
-                return "hi"
-            if code.startswith("mr"):
-                return "mr"
-            # Heuristic: Devanagari script implies hi or mr
-            if any("\u0900" <= ch <= "\u097F" for ch in text):
-                return "hi"
-            return "en"
-        except LangDetectException:
-            # fallback heuristics
-            if any("\u0900" <= ch <= "\u097F" for ch in text):
-                return "hi"
-            return "en"
+        return detect_language(text)
 
     def translate_to_en(self, text: str, src_lang: str) -> str:
         if src_lang == "en":
@@ -109,7 +698,7 @@ class MultilingualNLP:
             # fallback: return text (no translation)
             return text
         try:
-            out = self.indic_to_en(text)
+            out = self._indic_to_en_batcher.submit(text).result()
             if isinstance(out, list) and out:
                 return out[0].get("translation_text", text)
             if isinstance(out, dict):
@@ -126,7 +715,33 @@ class MultilingualNLP:
             return text
         try:
             # The pipeline expects plain text and returns translation_text
-            out = self.en_to_indic(text)
+            out = self._en_to_indic_batcher.submit(text).result()
+            if isinstance(out, list) and out:
+                return out[0].get("translation_text", text)
+            if isinstance(out, dict):
+                return out.get("translation_text", text)
+        except Exception:
+            return text
+        return text
+
+    def translate_short(self, text: str, tgt_lang: str) -> str:
+        """
+        translate_from_en for short fixed strings such as command replies ("Opening YouTube.").
+        Greedy decoding capped at about twice the input length, so the decoder stops after a
+        handful of steps instead of running to the model's default length limit.
+        """
+        if tgt_lang == "en":
+            return text
+        self._ensure_en_to_indic()
+        if self.en_to_indic is None:
+            return text
+        try:
+            tokenizer = getattr(self.en_to_indic, "tokenizer", None)
+            n_tokens = len(tokenizer(text).input_ids) if tokenizer is not None else len(text.split())
+            with torch.inference_mode():
+                out = self.en_to_indic(
+                    text, max_new_tokens=max(16, 2 * n_tokens), num_beams=1, do_sample=False
+                )
             if isinstance(out, list) and out:
                 return out[0].get("translation_text", text)
             if isinstance(out, dict):
@@ -140,66 +755,256 @@ class MultilingualNLP:
         Use generator pipeline to produce an English answer (or same language depending on model).
         A simple context concatenation is used to give short memory.
         """
+        return self.generate_answer_async(prompt).result()
+
+    def generate_answer_async(self, prompt: str) -> Future:
+        """
+        Like generate_answer, but returns a Future[str]. Concurrent calls are batched together.
+        PyTorch seq2seq generators go through _encoded_batcher (history encoder states are
+        cached, only the new user text is encoded); other generators (ONNX Runtime) get the
+        contextual prompt string through _generate_batcher.
+        """
+        result: Future = Future()
+        self._ensure_generator()
         if self.generator is None:
-            return "I'm unable to load the language model right now. Please try again later."
+            result.set_result("I'm unable to load the language model right now. Please try again later.")
+            return result
 
-        # Add short context
-        contextual_prompt = prompt
-        if self.history:
-            # append last few turns to prompt to give context (keeps prompt small)
-            recent = [h["text"] for h in self.history[-(SHORT_HISTORY_LIMIT // 2):]]
-            contextual_prompt = " ".join(recent) + "\nUser: " + prompt
+        if self._encoded_batcher is not None:
+            try:
+                raw = self._encoded_batcher.submit(self._encoded_inputs(prompt))
+            except Exception as e:
+                raw = Future()
+                raw.set_exception(e)
+        elif self._generate_batcher is not None:
+            raw = self._generate_batcher.submit(self._contextual_prompt(prompt))
+        else:
+            # causal-LM fallback isn't batched (no pad token); run it inline
+            raw = Future()
+            try:
+                raw.set_result(self.generator(self._contextual_prompt(prompt), **self._generation_kwargs()))
+            except Exception as e:
+                raw.set_exception(e)
+        raw.add_done_callback(lambda f: self._finish_answer(f, result))
+        return result
 
+    def _finish_answer(self, raw: Future, result: Future) -> None:
         try:
+            outputs = raw.result()
+            out = outputs[0] if isinstance(outputs, list) else outputs
             if self.generation_task == "text2text-generation":
-                outputs = self.generator(contextual_prompt, max_new_tokens=120)
-                text = outputs[0].get("generated_text") or outputs[0].get("summary_text") or ""
+                text = out.get("generated_text") or out.get("summary_text") or ""
             else:
-                outputs = self.generator(contextual_prompt, max_length=120, num_return_sequences=1)
-                text = outputs[0].get("generated_text", outputs[0].get("generated_text", ""))
+                text = out.get("generated_text", "")
             text = text.strip()
             # Save to history
             self._append_history("assistant", text)
-            return text
+            result.set_result(text)
         except Exception:
-            return "I ran into a problem generating a response."
+            result.set_result("I ran into a problem generating a response.")
+
+    def _recent_history(self) -> List[str]:
+        # last few turns used as context (keeps prompt small)
+        return [h["text"] for h in self.history[-(SHORT_HISTORY_LIMIT // 2):]]
+
+    def _contextual_prompt(self, prompt: str) -> str:
+        # Add short context
+        contextual_prompt = prompt
+        recent = self._recent_history()
+        if recent:
+            # append last few turns to prompt to give context
+            contextual_prompt = " ".join(recent) + "\nUser: " + prompt
+        return contextual_prompt
+
+    def _can_reuse_encoder(self) -> bool:
+        model = getattr(self.generator, "model", None)
+        return (
+            self.generation_task == "text2text-generation"
+            and isinstance(model, torch.nn.Module)
+            and hasattr(model, "get_encoder")
+        )
+
+    def _encode_segment(self, text: str) -> Tuple["torch.Tensor", "torch.Tensor"]:
+        model = self.generator.model
+        enc = self.generator.tokenizer(text, return_tensors="pt").to(model.device)
+        hidden = model.get_encoder()(input_ids=enc.input_ids, attention_mask=enc.attention_mask).last_hidden_state
+        return hidden, enc.attention_mask
+
+    def _encoded_inputs(self, prompt: str) -> Tuple["torch.Tensor", "torch.Tensor"]:
+        """
+        Encoder states + attention mask for the contextual prompt. Each history turn is encoded
+        once and its states kept; on later turns only the new user text is encoded. The decoder
+        cross-attends over the concatenated states (fusion-in-decoder style), so history prefill
+        is not redone every turn. _encoder_lock only covers the cache lookups/updates.
+        """
+        recent = self._recent_history()
+        with self._encoder_lock:
+            # evict states for turns that have dropped out of the context window
+            for key in [k for k in self._encoder_cache if k not in recent]:
+                del self._encoder_cache[key]
+            parts = [self._encoder_cache.get(text) for text in recent]
+
+        with torch.inference_mode():
+            encoded = {}
+            for i, text in enumerate(recent):
+                if parts[i] is None:
+                    parts[i] = encoded[text] = self._encode_segment(text)
+            if encoded:
+                with self._encoder_lock:
+                    self._encoder_cache.update(encoded)
+            # the user turn changes every time; it isn't cached
+            parts.append(self._encode_segment("User: " + prompt if recent else prompt))
+            hidden = torch.cat([h for h, _ in parts], dim=1)
+            mask = torch.cat([m for _, m in parts], dim=1)
+        return hidden, mask
+
+    def _generation_kwargs(self) -> dict:
+        if self.generation_task == "text2text-generation":
+            if self.quality == "best":
+                # keep the model's own (beam search) settings when quality was asked for
+                return {"max_new_tokens": 120}
+            return {"max_new_tokens": 120, "num_beams": 1}
+        return {"max_length": 120, "num_return_sequences": 1}
+
+    def _run_generator(self, prompt: str, streamer: TextIteratorStreamer) -> None:
+        try:
+            if self._encoded_batcher is not None:
+                # same inputs as generate_answer_async (cached history encoder states), so an
+                # answer doesn't depend on whether it was streamed
+                hidden, mask = self._encoded_inputs(prompt)
+                with torch.inference_mode():
+                    self.generator.model.generate(
+                        encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                        attention_mask=mask,
+                        streamer=streamer,
+                        **self._generation_kwargs(),
+                    )
+            else:
+                self.generator(self._contextual_prompt(prompt), streamer=streamer, **self._generation_kwargs())
+        except Exception:
+            # unblock the consumer; it yields whatever was produced so far
+            streamer.end()
+
+    def stream_generate(self, prompt: str) -> Iterator[str]:
+        """
+        Like generate_answer, but yields complete clauses while the model is still decoding.
+        """
+        self._ensure_generator()
+        if self.generator is None:
+            yield "I'm unable to load the language model right now. Please try again later."
+            return
+        try:
+            streamer = TextIteratorStreamer(self.generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        except Exception:
+            # no streaming support: generate the whole answer and yield it in one piece
+            yield self.generate_answer(prompt)
+            return
+
+        worker = threading.Thread(target=self._run_generator, args=(prompt, streamer), daemon=True)
+        worker.start()
+        # Yielded segments are raw slices of the model output (whitespace included), so
+        # "".join() of everything yielded is exactly the generated text
+        raw = []
+        pending = ""
+        for piece in streamer:
+            raw.append(piece)
+            pending += piece
+            end = 0
+            for m in CLAUSE_RE.finditer(pending):
+                if m.end() == len(pending):
+                    # the terminator is last in the buffer; wait for the next piece to see
+                    # whether it ends the clause or is part of e.g. "3.10"
+                    break
+                end = m.end()
+                yield m.group(0)
+            pending = pending[end:]
+        if pending.strip():
+            yield pending
+        # Save to history
+        self._append_history("assistant", "".join(raw).strip())
 
     def _append_history(self, role: str, text: str):
         entry = {"role": role, "text": text, "ts": int(time.time())}
         self.history.append(entry)
         self.history = self.history[-SHORT_HISTORY_LIMIT:]
-        # persist minimal memory to disk too
+        # persist minimal memory to disk too (written by _persist_loop)
+        self._persist_q.put(entry)
+
+    def answer_direct(self, user_text: str, lang: str) -> Optional[str]:
+        """
+        Ask the generator to answer straight in `lang`, skipping both translation passes.
+        Returns None when that isn't possible or the model answered in another language;
+        the caller should then use the translate -> generate -> translate bridge.
+        """
+        if lang not in SUPPORTED_LANGS or not self._direct_ok.get(lang, True):
+            return None
+        self._ensure_generator()
+        if self._generate_batcher is None:
+            # only the text2text model follows "respond in X" instructions
+            return None
+        prompt = f"Respond in {SUPPORTED_LANGS[lang]}. Question: {user_text}\nAnswer:"
         try:
-            with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            out = self._generate_batcher.submit(prompt).result()
+            out = out[0] if isinstance(out, list) else out
+            text = (out.get("generated_text") or "").strip()
         except Exception:
-            data = {"history": []}
-        hist = data.get("history", [])
-        hist.append(entry)
-        hist = hist[-SHORT_HISTORY_LIMIT:]
-        data["history"] = hist
-        with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            return None
+        # hi vs mr is not reliably separable on short text; any Devanagari answer is accepted for both
+        matches = detect_language(text) == lang or (lang in ("hi", "mr") and _has_devanagari(text))
+        if not text or not matches:
+            # don't pay for a wasted generation on every turn; stick to the bridge for this language
+            self._direct_ok[lang] = False
+            return None
+        self._append_history("assistant", text)
+        return text
 
-    def answer_in_user_language(self, user_text: str) -> Tuple[str, str]:
+    def answer_in_user_language(self, user_text: str, src_lang: Optional[str] = None) -> Tuple[str, str]:
         """
-        Detect language, translate to English if needed, generate an English answer,
-        then translate back to user language. Returns (final_answer, detected_lang).
+        Detect language (unless src_lang is given), try to answer directly in that language,
+        otherwise translate to English, generate an English answer, then translate back.
+        Returns (final_answer, detected_lang).
         """
-        src_lang = self.detect_language(user_text)
-        # Translate user text to English for robust generation if needed
-        english_query = user_text
-        if src_lang != "en":
-            english_query = self.translate_to_en(user_text, src_lang)
+        if src_lang is None:
+            src_lang = self.detect_language(user_text)
+        if src_lang == "en":
+            # common case: no translators, no direct-answer attempt
+            return self.generate_answer(user_text), src_lang
+
+        direct = self.answer_direct(user_text, src_lang)
+        if direct:
+            return direct, src_lang
+        # Translate user text to English for robust generation
+        english_query = self.translate_to_en(user_text, src_lang)
 
         # Generate English (or model language) answer
         english_answer = self.generate_answer(english_query)
 
-        # Translate back to user's language if needed
-        final_answer = english_answer
-        if src_lang != "en":
-            final_answer = self.translate_from_en(english_answer, src_lang)
-        return final_answer, src_lang
+        # Translate back to user's language
+        return self.translate_from_en(english_answer, src_lang), src_lang
+
+    def stream_answer(self, user_text: str, src_lang: Optional[str] = None) -> Iterator[str]:
+        """
+        Streaming variant of answer_in_user_language: yields the answer clause by clause,
+        each one already translated back to the user's language. Joining the yielded
+        segments with "" gives the full reply.
+        """
+        if src_lang is None:
+            src_lang = self.detect_language(user_text)
+        if src_lang == "en":
+            yield from self.stream_generate(user_text)
+            return
+
+        # one generator call instead of three when the model can answer in the user's language;
+        # that answer isn't streamed, but it's ready before the bridge's first clause would be
+        direct = self.answer_direct(user_text, src_lang)
+        if direct:
+            yield direct
+            return
+        english_query = self.translate_to_en(user_text, src_lang)
+        for clause in self.stream_generate(english_query):
+            clause = clause.strip()
+            if clause:
+                yield self.translate_from_en(clause, src_lang) + " "
 
     # Optional small utility for intent detection (very basic)
     def detect_intent(self, text: str) -> Tuple[str, Optional[str]]:
@@ -207,14 +1012,14 @@ class MultilingualNLP:
         Return simple intent and optional entity.
         Example intents: open_app, open_website, get_time, play_music, question
         """
-        q = text.lower()
-        if any(k in q for k in ["whatsapp", "व्हाट्स", "व्हाट्सअॅप"]):
-            return "open_app", "whatsapp"
-        if "youtube" in q or "यूट्यूब" in q:
-            return "open_app", "youtube"
-        if "time" in q or "वेळ" in q or "समय" in q:
+        q = text.casefold()
+        tag = match_intent(q)
+        if tag in ("whatsapp", "youtube"):
+            return "open_app", tag
+        if tag == "time":
             return "get_time", None
-        if "play" in q or "गाण" in q or "music" in q:
+        # detect_intent also treats a bare "play ..." as music
+        if tag == "music" or "play" in q:
             return "play_music", None
         if "." in q:
             return "open_website", q